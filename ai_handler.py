@@ -1,15 +1,113 @@
 import os
+import re
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import time
+import random
+import threading
+import email.utils
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+from llm_cache import LLMCache
+
+# 匹配总结文件中的Markdown标题行（合并时跳过）
+_HEADING_RE = re.compile(rb'(?m)^[ \t]*#.*\n?')
+# 匹配文件名中的数字编号（用于排序）
+_NUM_RE = re.compile(r'\d+')
+# 句子结束位置（用于切分超长段落）
+_SENTENCE_RE = re.compile(r'(?<=[。！？!?.…])\s*')
+
+# 超长章节分块总结时每块的token数，以及为提示词和输出预留的token数
+_CHUNK_TOKENS = 3000
+_RESERVED_TOKENS = 1500
+
+def _json_dumps(obj):
+    """序列化为JSON字节（优先使用orjson）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+def _json_loads(data):
+    """解析JSON（优先使用orjson）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _parse_retry_after(value):
+    """解析Retry-After响应头（秒数或HTTP日期），返回需要等待的秒数"""
+    if not value:
+        return 0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0
+
+def _estimate_tokens(text):
+    """无tokenizer时估算token数：ASCII文本约4个字符一个token，中文等非ASCII字符约每字一个token"""
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
 
 class AIHandler:
+    # 按模型名缓存的tiktoken编码器（False表示无法获取，按字符数估算）
+    _encoders = {}
+    
     def __init__(self, config):
         self.config = config
         self.api_base = config.get('api_base', '')
         self.api_key = config.get('api_key', '')
         self.model_name = config.get('model_name', 'gpt-3.5-turbo')
         self.system_prompt = config.get('system_prompt', '请总结以下小说章节的核心剧情，保留关键人物和冲突。')
+        self.max_concurrency = config.get('max_concurrency', 8)
+        self.context_window = config.get('context_window', 16000)
+        self.stream = config.get('stream', True)
+        
+        # 复用同一个会话，保持长连接，避免每个章节都重新进行TCP/TLS握手
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(16, self.max_concurrency), max_retries=0)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._update_session_headers()
+        
+        # 常驻线程池，所有总结请求共用，避免每批任务都重新创建线程
+        self._executor = ThreadPoolExecutor(max_workers=max(1, self.max_concurrency))
+        # 全局限制同时进行的API请求数（长章节分块总结时也不会超过max_concurrency）
+        self._request_slots = threading.BoundedSemaphore(max(1, self.max_concurrency))
+        
+        self._cache = None
+        self._init_cache()
+    
+    def _init_cache(self):
+        """根据配置启用或关闭响应缓存"""
+        if not self.config.get('cache_enabled', True):
+            self._cache = None
+        elif self._cache is None:
+            try:
+                self._cache = LLMCache()
+            except Exception as e:
+                print(f"初始化缓存失败: {str(e)}")
+                self._cache = None
+    
+    def _update_session_headers(self):
+        """更新会话的公共请求头"""
+        self._session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        })
     
     def update_config(self, config):
         """更新配置"""
@@ -18,10 +116,150 @@ class AIHandler:
         self.api_key = config.get('api_key', '')
         self.model_name = config.get('model_name', 'gpt-3.5-turbo')
         self.system_prompt = config.get('system_prompt', '请总结以下小说章节的核心剧情，保留关键人物和冲突。')
+        old_concurrency = self.max_concurrency
+        self.max_concurrency = config.get('max_concurrency', 8)
+        self.context_window = config.get('context_window', 16000)
+        self.stream = config.get('stream', True)
+        self._update_session_headers()
+        self._init_cache()
+        # 并发数变化时重建线程池，旧线程池在已提交的任务完成后自行退出
+        if self.max_concurrency != old_concurrency:
+            old_executor = self._executor
+            self._executor = ThreadPoolExecutor(max_workers=max(1, self.max_concurrency))
+            old_executor.shutdown(wait=False)
+            self._request_slots = threading.BoundedSemaphore(max(1, self.max_concurrency))
     
     def generate_summary(self, text, max_retries=3):
         """调用AI API生成总结"""
+        # 相同模型、提示词和输入直接返回缓存的总结
+        cache_key = None
+        if self._cache is not None:
+            cache_key = LLMCache.make_key(self.model_name, self.system_prompt, text)
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        summary = self._summarize_text(text, max_retries)
+        if cache_key is not None:
+            self._cache.set(cache_key, summary)
+        return summary
+    
+    def submit(self, content):
+        """提交一个总结任务到常驻线程池，返回Future"""
+        return self._executor.submit(self.generate_summary, content)
+    
+    def generate_summaries_batch(self, contents, max_concurrency=None):
+        """并发生成多段文本的总结，按完成顺序逐个产出(index, summary, error)
+        
+        contents可以是边生产边消费的迭代器（如队列），在途请求数不超过max_concurrency，
+        已完成的结果会在提交新请求的间隙及时产出。
+        """
+        max_workers = max(1, max_concurrency or self.max_concurrency)
+        pending = {}
+        
+        def collect(done):
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    yield index, future.result(), None
+                except Exception as e:
+                    yield index, None, e
+        
+        try:
+            for i, content in enumerate(contents):
+                pending[self.submit(content)] = i
+                # 产出已完成的结果；在途请求达到上限时等待空位
+                yield from collect([future for future in pending if future.done()])
+                while len(pending) >= max_workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from collect(done)
+            
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from collect(done)
+        finally:
+            # 调用方提前停止迭代时，取消尚未开始的请求
+            for future in pending:
+                future.cancel()
+    
+    def _count_tokens(self, text):
+        """统计文本的token数（无法使用tiktoken时按字符类型估算）"""
+        encoder = AIHandler._encoders.get(self.model_name)
+        if encoder is None:
+            encoder = False
+            if tiktoken is not None:
+                try:
+                    encoder = tiktoken.encoding_for_model(self.model_name)
+                except KeyError:
+                    # 非OpenAI模型使用通用编码近似
+                    try:
+                        encoder = tiktoken.get_encoding('cl100k_base')
+                    except Exception:
+                        encoder = False
+                except Exception:
+                    encoder = False
+            AIHandler._encoders[self.model_name] = encoder
+        if encoder is False:
+            return _estimate_tokens(text)
+        return len(encoder.encode(text, disallowed_special=()))
+    
+    def _hard_split(self, piece, window_tokens):
+        """将没有可用句子边界的超长片段按字符二分，直到每段不超过window_tokens"""
+        if len(piece) < 2 or self._count_tokens(piece) <= window_tokens:
+            return [piece]
+        middle = len(piece) // 2
+        return self._hard_split(piece[:middle], window_tokens) + self._hard_split(piece[middle:], window_tokens)
+    
+    def _split_text(self, text, window_tokens):
+        """按段落/句子边界将长文本切分为不超过window_tokens的若干块"""
+        pieces = []
+        for paragraph in text.split('\n'):
+            if self._count_tokens(paragraph) > window_tokens:
+                for sentence in _SENTENCE_RE.split(paragraph):
+                    if sentence:
+                        # 缺少标点的超长句子仍会超限，强制切开
+                        pieces.extend(self._hard_split(sentence, window_tokens))
+            else:
+                pieces.append(paragraph)
+        
+        windows = []
+        current = []
+        current_tokens = 0
+        for piece in pieces:
+            piece_tokens = self._count_tokens(piece)
+            if current and current_tokens + piece_tokens > window_tokens:
+                windows.append('\n'.join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += piece_tokens
+        if current:
+            windows.append('\n'.join(current))
+        return windows
+    
+    def _summarize_text(self, text, max_retries):
+        """生成总结，超出上下文长度的文本先分块并行总结，再对分块总结进行汇总"""
+        input_tokens = max(1, self.context_window - _RESERVED_TOKENS)
+        if self._count_tokens(text) <= input_tokens:
+            return self._request_summary(text, max_retries)
+        
+        # 分块大小不超过模型可用的输入长度
+        windows = self._split_text(text, min(_CHUNK_TOKENS, input_tokens))
+        if len(windows) < 2:
+            return self._request_summary(text, max_retries)
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(len(windows), self.max_concurrency))) as executor:
+            partial_summaries = list(executor.map(lambda window: self._request_summary(window, max_retries), windows))
+        
+        # 汇总结果仍可能超长，递归处理
+        return self._summarize_text('\n\n'.join(partial_summaries), max_retries)
+    
+    def _request_summary(self, text, max_retries):
+        """调用AI API对单段文本生成总结"""
         for retry in range(max_retries):
+            # 网络错误、429和5xx可以重试，其他4xx（鉴权失败、请求错误等）直接失败
+            retryable = True
+            retry_after = 0
             try:
                 # 构建请求体
                 messages = [
@@ -33,134 +271,156 @@ class AIHandler:
                     "model": self.model_name,
                     "messages": messages,
                     "temperature": 0.7,
-                    "max_tokens": 1000
+                    "max_tokens": 1000,
+                    "stream": self.stream
                 }
                 
-                # 发送请求
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
+                # 占用一个请求名额，等待重试期间不占用
+                with self._request_slots:
+                    # 发送请求（请求头已在会话中设置）
+                    response = self._session.post(
+                        f"{self.api_base}/v1/chat/completions",
+                        data=_json_dumps(data),
+                        timeout=30,
+                        stream=self.stream
+                    )
                 
-                response = requests.post(
-                    f"{self.api_base}/v1/chat/completions",
-                    headers=headers,
-                    json=data,
-                    timeout=30
-                )
-                
-                # 处理响应
-                if response.status_code == 200:
-                    result = response.json()
-                    return result['choices'][0]['message']['content'].strip()
-                else:
-                    raise Exception(f"API请求失败，状态码: {response.status_code}, 响应: {response.text}")
+                    # 处理响应
+                    with response:
+                        if response.status_code == 200:
+                            if response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                                return self._read_stream(response)
+                            result = _json_loads(response.content)
+                            return result['choices'][0]['message']['content'].strip()
+                        else:
+                            if response.status_code == 429:
+                                retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+                            elif 400 <= response.status_code < 500:
+                                retryable = False
+                            raise Exception(f"API请求失败，状态码: {response.status_code}, 响应: {response.text}")
             except Exception as e:
-                if retry < max_retries - 1:
-                    # 重试前等待
-                    wait_time = 2 ** retry
+                if retryable and retry < max_retries - 1:
+                    # 重试前等待：指数退避加随机抖动，避免并发请求同时重试；服务器指定了Retry-After时至少等待该时长
+                    wait_time = max(retry_after, random.uniform(0, min(2 ** retry, 30)))
                     time.sleep(wait_time)
                 else:
                     raise Exception(f"生成总结失败: {str(e)}")
     
-    def summarize_file(self, file_path, output_path):
-        """读取文件内容并生成总结"""
+    def _read_stream(self, response):
+        """读取SSE流式响应，逐段累积增量内容，结束后一次性拼接"""
+        parts = []
+        for line in response.iter_lines():
+            if not line.startswith(b'data:'):
+                continue
+            payload = line[5:].strip()
+            if payload == b'[DONE]':
+                break
+            chunk = _json_loads(payload)
+            if 'error' in chunk:
+                raise Exception(f"API返回错误: {chunk['error']}")
+            choices = chunk.get('choices')
+            if choices:
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    parts.append(content)
+        return ''.join(parts).strip()
+    
+    def summarize_chapter(self, title, content, output_path):
+        """直接对内存中的章节内容生成总结并保存"""
+        # 生成总结
+        summary = self.generate_summary(content)
+        
+        # 保存总结（一次性编码后以二进制写入）
+        with open(output_path, 'wb') as f:
+            f.write(f"# {title} 总结\n\n{summary}".encode('utf-8'))
+        
+        return True
+    
+    def summarize_file(self, file_path, output_path, content=None):
+        """读取文件内容并生成总结（已提供content时不再读取文件）"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 生成总结
-            summary = self.generate_summary(content)
+            if content is None:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
             
-            # 保存总结
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(f"# {os.path.basename(file_path).replace('.md', '')} 总结\n\n")
-                f.write(summary)
-            
-            return True
+            return self.summarize_chapter(os.path.basename(file_path).replace('.md', ''), content, output_path)
         except Exception as e:
             raise Exception(f"处理文件 {file_path} 失败: {str(e)}")
     
     def summarize_files(self, file_list, output_dir):
-        """批量生成总结"""
-        import os
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        results = []
-        summary_files = []
+        """批量生成总结，file_list元素为Markdown文件路径或(title, content, output_path)元组"""
+        os.makedirs(output_dir, exist_ok=True)
         
-        for file_path in file_list:
+        def summarize_one(entry):
+            # 元组直接使用内存中的章节内容，不再从磁盘读取
+            if isinstance(entry, tuple):
+                title, content, output_path = entry
+                try:
+                    success = self.summarize_chapter(title, content, output_path)
+                    return (title, output_path, success)
+                except Exception as e:
+                    return (title, None, False, f"处理章节 {title} 失败: {str(e)}")
+            
+            file_path = entry
             try:
                 # 生成输出文件名
-                base_name = os.path.basename(file_path)
-                output_path = os.path.join(output_dir, f"{os.path.splitext(base_name)[0]}_summary.md")
+                stem = os.path.splitext(os.path.basename(file_path))[0]
+                output_path = os.path.join(output_dir, f"{stem}_summary.md")
                 
                 # 生成并保存总结
                 success = self.summarize_file(file_path, output_path)
-                results.append((file_path, output_path, success))
-                if success:
-                    summary_files.append(output_path)
+                return (file_path, output_path, success)
             except Exception as e:
-                results.append((file_path, None, False, str(e)))
+                return (file_path, None, False, str(e))
+        
+        # 在常驻线程池中并发请求API，最多同时处理max_concurrency个文件，结果保持输入顺序
+        results = list(self._executor.map(summarize_one, file_list))
+        
+        summary_files = [result[1] for result in results if result[2]]
         
         return results, summary_files
     
-    def merge_summaries(self, summary_files, output_path):
-        """将所有章节的总结合并为一个summary.md文件"""
-        import os
-        import re
+    def merge_summaries(self, summary_files, output_path, sort=True):
+        """将所有章节的总结合并为一个summary.md文件（sort为False时保持传入顺序，不按文件名编号重新排序）"""
+        # 每个文件只计算一次文件名和章节标题，并提取其中所有数字编号作为排序键（支持"第X卷第Y章"这类多级编号）
+        entries = []
+        for summary_file in summary_files:
+            base_name = os.path.basename(summary_file)
+            chapter_title = base_name.replace('_summary.md', '').replace('_', ' ')
+            sort_key = tuple(map(int, _NUM_RE.findall(base_name)))
+            entries.append((sort_key, summary_file, base_name, chapter_title))
         
         # 检查是否有文件名包含数字编号
-        has_numbering = any(re.search(r'\d+', os.path.basename(f)) for f in summary_files)
-        
-        if has_numbering:
-            # 如果有数字编号，按编号排序
-            def sort_key(file_path):
-                # 提取文件名中的数字部分
-                file_name = os.path.basename(file_path)
-                match = re.search(r'(\d+)', file_name)
-                if match:
-                    return int(match.group(1))
-                return 0
-            
-            # 复制列表并排序，避免修改原始列表
-            sorted_files = sorted(summary_files, key=sort_key)
-        else:
-            # 如果没有数字编号，保持原始顺序
-            sorted_files = summary_files
+        if sort and any(entry[0] for entry in entries):
+            # 如果有数字编号，按编号排序（稳定排序，编号相同的保持原始顺序）
+            entries.sort(key=lambda entry: entry[0] or (0,))
         
-        with open(output_path, 'w', encoding='utf-8') as merged_file:
+        with open(output_path, 'wb', buffering=1 << 20) as merged_file:
             # 写入标题
-            merged_file.write("# 全书总览\n\n")
+            merged_file.write("# 全书总览\n\n".encode('utf-8'))
             
             # 写入目录
-            merged_file.write("## 目录\n\n")
-            for i, summary_file in enumerate(sorted_files):
-                chapter_title = os.path.basename(summary_file).replace('_summary.md', '').replace('_', ' ')
-                merged_file.write(f"{i+1}. [{chapter_title}](#{i+1})\n")
+            merged_file.write("## 目录\n\n".encode('utf-8'))
+            for i, (_, _, _, chapter_title) in enumerate(entries):
+                merged_file.write(f"{i+1}. [{chapter_title}](#{i+1})\n".encode('utf-8'))
             
-            merged_file.write("\n")
+            merged_file.write(b"\n")
             
             # 写入各个章节的总结内容
-            for i, summary_file in enumerate(sorted_files):
+            for i, (_, summary_file, base_name, chapter_title) in enumerate(entries):
                 try:
-                    with open(summary_file, 'r', encoding='utf-8') as f:
+                    with open(summary_file, 'rb') as f:
                         content = f.read()
                     
-                    # 提取章节标题
-                    chapter_title = os.path.basename(summary_file).replace('_summary.md', '').replace('_', ' ')
-                    
                     # 写入章节标题和内容
-                    merged_file.write(f"## {i+1}. {chapter_title}\n\n")
+                    merged_file.write(f"## {i+1}. {chapter_title}\n\n".encode('utf-8'))
                     
                     # 跳过原始文件的标题行，直接写入总结内容
-                    lines = content.split('\n')
-                    content_lines = [line for line in lines if not line.strip().startswith('#')]
-                    merged_file.write('\n'.join(content_lines).strip() + '\n\n')
+                    content = _HEADING_RE.sub(b'', content.replace(b'\r\n', b'\n'))
+                    merged_file.write(content.strip() + b'\n\n')
                     
                 except Exception as e:
-                    merged_file.write(f"## {i+1}. {os.path.basename(summary_file)}\n\n")
-                    merged_file.write(f"读取总结内容失败: {str(e)}\n\n")
+                    merged_file.write(f"## {i+1}. {base_name}\n\n".encode('utf-8'))
+                    merged_file.write(f"读取总结内容失败: {str(e)}\n\n".encode('utf-8'))
         
         return True
\ No newline at end of file
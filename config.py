@@ -8,7 +8,11 @@ class ConfigManager:
             'api_base': 'https://api.openai.com',
             'api_key': '',
             'model_name': 'gpt-3.5-turbo',
-            'system_prompt': '请总结以下小说章节的核心剧情，保留关键人物和冲突。'
+            'system_prompt': '请总结以下小说章节的核心剧情，保留关键人物和冲突。',
+            'max_concurrency': 8,
+            'cache_enabled': True,
+            'context_window': 16000,
+            'stream': True
         }
         self.config = self.load_config()
     
@@ -1,45 +1,159 @@
 import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import ebooklib
 from ebooklib import epub
-from bs4 import BeautifulSoup
+import lxml.html
 from lxml import etree
 
+# 文件名中不允许出现的字符统一替换为下划线
+_SAFE_TRANS = str.maketrans({c: '_' for c in '<>:"/\\|?*'})
+
+def sanitize_filename(title):
+    """将标题转换为可用作文件名的字符串（不允许的字符替换为下划线）"""
+    return title.translate(_SAFE_TRANS)
+
+# 两个及以上连续半角空格视为分段（全角空格常用于标题中的分隔，不在此列）
+_WS_RE = re.compile(r' {2,}')
+
+# lxml解析器对象内部带锁，多线程共享会串行化解析，因此每个线程使用独立的解析器
+_thread_local = threading.local()
+
+def _get_html_parser():
+    """获取当前线程的lxml HTML解析器（生成支持text_content()的HtmlElement）"""
+    parser = getattr(_thread_local, 'html_parser', None)
+    if parser is None:
+        parser = lxml.html.HTMLParser(encoding='utf-8')
+        _thread_local.html_parser = parser
+    return parser
+
+def _parse_html(html_content):
+    """使用lxml解析HTML（str或UTF-8字节），返回根节点（空文档返回None）"""
+    # lxml不接受带编码声明的str，统一转为UTF-8字节再解析
+    if isinstance(html_content, str):
+        html_content = html_content.encode('utf-8')
+    try:
+        return etree.fromstring(html_content, _get_html_parser())
+    except (etree.ParserError, etree.XMLSyntaxError):
+        return None
+
+def _clean_whitespace(text):
+    """清理空白：连续空白处分行，去除每行首尾空白并丢弃空行"""
+    text = _WS_RE.sub('\n', text)
+    return '\n'.join(filter(None, (line.strip() for line in text.splitlines())))
+
+def _extract_worker(html_content):
+    """从HTML内容中提取纯文本（模块级函数，可在线程池中并行执行）"""
+    root = _parse_html(html_content)
+    if root is None:
+        return ''
+    # 移除脚本和样式
+    etree.strip_elements(root, 'script', 'style', with_tail=False)
+    # 获取文本
+    text = root.text_content()
+    # 提前释放解析树，避免清理空白时DOM与文本副本同时占用内存
+    del root
+    # 清理空白
+    return _clean_whitespace(text)
+
+def _imap_parallel(func, items):
+    """在线程池中并行执行func，按原顺序逐个产出结果（lxml解析期间会释放GIL）"""
+    items = list(items)
+    if len(items) < 2:
+        yield from map(func, items)
+        return
+    with ThreadPoolExecutor(max_workers=min(len(items), os.cpu_count() or 1)) as executor:
+        futures = [executor.submit(func, item) for item in items]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            # 提前停止迭代时取消尚未开始的任务
+            for future in futures:
+                future.cancel()
+
+def _map_parallel(func, items):
+    """在线程池中按顺序并行执行func，返回结果列表"""
+    return list(_imap_parallel(func, items))
+
 class EpubHandler:
     def __init__(self):
         self.chapter_regex = r'^(?:(.+[ 　]+)|())(第[一二三四五六七八九十零〇百千万两0123456789]+[章卷]|卷[一二三四五六七八九十零〇百千万两0123456789]+|chap(?:ter)\.?|vol(?:ume)?\.?|book|bk)(?:[ 　]+(?:\S.*)?)?[ 　]*$'
-        self.soup = None
+        self.chapter_xpath = r"//*[((name()='h1' or name()='h2') and re:test(., '\s*((chapter|book|section|part)\s+)|((prolog|prologue|epilogue)(\s+|$))', 'i')) or @class = 'chapter']"
+        # 文档HTML原始字节（按文档ID）及其纯文本缓存，在load_epub中填充
+        self._docs = {}
+        self._text_cache = {}
+        # 文件名到条目的索引（ebooklib的get_item_with_href是线性查找）
+        self._href_index = {}
+        # 已确认存在的输出目录，重复保存时不再创建
+        self._ensured_dirs = set()
+    
+    @property
+    def chapter_regex(self):
+        """章节标题正则表达式"""
+        return self._chapter_regex
+    
+    @chapter_regex.setter
+    def chapter_regex(self, pattern):
+        # 设置时预编译，避免在逐行循环中重复编译；修改后立即生效
+        self._chapter_regex = pattern
+        self._chapter_re = re.compile(pattern, re.IGNORECASE)
+    
+    @property
+    def chapter_xpath(self):
+        """章节节点XPath表达式"""
+        return self._chapter_xpath
+    
+    @chapter_xpath.setter
+    def chapter_xpath(self, expression):
+        # 设置时预编译，避免对每个文档重复编译；修改后立即生效
+        self._chapter_xpath = expression
+        self._chapter_xp = etree.XPath(expression, namespaces={'re': 'http://exslt.org/regular-expressions'})
     
     def load_epub(self, epub_path):
         """加载Epub文件"""
         try:
             self.book = epub.read_epub(epub_path)
+            # 缓存所有文档的原始字节供各检测方法复用，由lxml直接按UTF-8解析，无需先解码再编码
+            self._docs = {
+                item.get_id(): item.get_content()
+                for item in self.book.get_items()
+                if item.get_type() == ebooklib.ITEM_DOCUMENT
+            }
+            self._text_cache = {}
+            self._href_index = {item.get_name(): item for item in self.book.get_items()}
             return True
         except Exception as e:
             raise Exception(f"加载Epub文件失败: {str(e)}")
     
     def extract_text_from_html(self, html_content):
         """从HTML内容中提取纯文本"""
-        self.soup = BeautifulSoup(html_content, 'html.parser')
-        # 移除脚本和样式
-        for script in self.soup(['script', 'style']):
-            script.decompose()
-        # 获取文本并清理空白
-        text = self.soup.get_text()
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = '\n'.join(chunk for chunk in chunks if chunk)
+        return _extract_worker(html_content)
+    
+    def _get_item_text(self, item_id):
+        """获取文档的纯文本（按文档ID缓存）"""
+        text = self._text_cache.get(item_id)
+        if text is None:
+            html_content = self._docs.get(item_id)
+            if html_content is None:
+                html_content = self.book.get_item_with_id(item_id).get_content()
+            text = self.extract_text_from_html(html_content)
+            self._text_cache[item_id] = text
         return text
     
     def extract_all_text(self):
         """提取Epub中的所有文本内容"""
+        # 并行提取尚未缓存的文档文本
+        pending = [item_id for item_id in self._docs if item_id not in self._text_cache]
+        texts = _map_parallel(_extract_worker, (self._docs[item_id] for item_id in pending))
+        self._text_cache.update(zip(pending, texts))
+        
         all_text = []
-        for item in self.book.get_items():
-            if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                html_content = item.get_content().decode('utf-8')
-                text = self.extract_text_from_html(html_content)
-                if text:
-                    all_text.append(text)
+        for item_id in self._docs:
+            text = self._get_item_text(item_id)
+            if text:
+                all_text.append(text)
         return '\n'.join(all_text)
     
     def split_by_regex(self, text):
@@ -50,7 +164,7 @@ class EpubHandler:
         current_content = []
         
         for line in lines:
-            match = re.match(self.chapter_regex, line, re.IGNORECASE)
+            match = self._chapter_re.match(line)
             if match:
                 # 保存当前章节
                 if current_chapter:
@@ -78,19 +192,20 @@ class EpubHandler:
         """使用XPath表达式检测章节"""
         chapters = []
         try:
-            # 创建lxml解析器
-            parser = etree.HTMLParser()
-            tree = etree.fromstring(html_content, parser)
-            
-            # 注册正则表达式命名空间
-            ns = {'re': 'http://exslt.org/regular-expressions'}
+            # 使用lxml解析器解析文档
+            tree = _parse_html(html_content)
+            if tree is None:
+                return chapters
             
-            # 使用提供的XPath表达式查找章节节点
-            chapter_nodes = tree.xpath("//*[((name()='h1' or name()='h2') and re:test(., '\s*((chapter|book|section|part)\s+)|((prolog|prologue|epilogue)(\s+|$))', 'i')) or @class = 'chapter']", namespaces=ns)
+            # 使用预编译的XPath表达式一次性找出所有章节节点
+            chapter_nodes = self._chapter_xp(tree)
             
             if not chapter_nodes:
                 return chapters
             
+            # 章节节点集合，遍历兄弟节点时直接按节点判断，无需再次执行XPath
+            chapter_node_set = set(chapter_nodes)
+            
             # 提取章节内容
             for i, chapter_node in enumerate(chapter_nodes):
                 # 获取章节标题
@@ -98,28 +213,16 @@ class EpubHandler:
                 
                 # 获取章节内容（当前章节节点到下一个章节节点之间的内容）
                 content_elements = []
-                next_sibling = chapter_node.getnext()
-                
-                while next_sibling is not None:
-                    # 检查是否是下一个章节节点
-                    is_next_chapter = False
-                    try:
-                        is_next_chapter = next_sibling.xpath("self::*[((name()='h1' or name()='h2') and re:test(., '\s*((chapter|book|section|part)\s+)|((prolog|prologue|epilogue)(\s+|$))', 'i')) or @class = 'chapter']", namespaces=ns)
-                    except:
-                        pass
-                    
-                    if is_next_chapter:
+                for next_sibling in chapter_node.itersiblings(etree.Element):
+                    # 只遍历元素节点（跳过注释等），遇到下一个章节节点时停止
+                    if next_sibling in chapter_node_set:
                         break
                     
                     # 添加当前兄弟节点的文本
                     content_elements.append(next_sibling.text_content())
-                    next_sibling = next_sibling.getnext()
                 
                 # 合并内容并清理
-                content = '\n'.join(content_elements)
-                lines = (line.strip() for line in content.splitlines())
-                chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                content = '\n'.join(chunk for chunk in chunks if chunk)
+                content = _clean_whitespace('\n'.join(content_elements))
                 
                 if title and content:
                     chapters.append({
@@ -134,86 +237,90 @@ class EpubHandler:
     
     def get_toc_chapters(self, include_all=False):
         """从TOC中获取章节"""
-        chapters = []
+        return list(self._iter_toc_chapters(include_all))
+    
+    def _iter_toc_chapters(self, include_all=False):
+        """按TOC顺序逐个产出章节"""
+        found = False
         
-        def process_toc_item(item, level=0):
+        # 使用显式栈按先序遍历TOC，避免深层目录的递归开销
+        stack = [(toc_item, 0) for toc_item in reversed(self.book.toc)]
+        while stack:
+            item, level = stack.pop()
             if level > 2:  # 只处理到二级目录
-                return
+                continue
             
             if hasattr(item, 'href'):
                 # 获取章节内容
-                content_item = self.book.get_item_with_href(item.href)
+                content_item = self._href_index.get(item.href)
                 if content_item:
-                    html_content = content_item.get_content().decode('utf-8')
-                    text = self.extract_text_from_html(html_content)
-                    chapters.append({
+                    text = self._get_item_text(content_item.get_id())
+                    found = True
+                    yield {
                         'title': item.title,
                         'content': text,
                         'href': item.href,
                         'level': level
-                    })
+                    }
             
-            # 处理子项
+            # 处理子项（逆序入栈，保证按原顺序出栈）
             if hasattr(item, 'items') and item.items:
-                for subitem in item.items:
-                    process_toc_item(subitem, level + 1)
-        
-        # 遍历TOC
-        for toc_item in self.book.toc:
-            process_toc_item(toc_item)
+                stack.extend((subitem, level + 1) for subitem in reversed(item.items))
         
         # 如果是获取所有可选择章节（用于人工选择），且TOC为空，则返回正则切分的章节
-        if include_all and not chapters:
+        if include_all and not found:
             all_text = self.extract_all_text()
             regex_chapters = self.split_by_regex(all_text)
             for i, chapter in enumerate(regex_chapters):
-                chapters.append({
+                yield {
                     'title': chapter['title'],
                     'content': chapter['content'],
                     'href': f'chapter_{i}.html',
                     'level': 0
-                })
-        
-        return chapters
+                }
     
     def get_all_chapters(self, detection_method='toc'):
         """获取所有可选择的章节（用于人工选择）"""
-        chapters = []
-        
-        # 根据指定的检测方法获取章节
+        return list(self.iter_all_chapters(detection_method))
+    
+    def iter_all_chapters(self, detection_method='toc'):
+        """逐个产出所有可选择的章节（用于人工选择时边检测边显示）"""
+        # 为每个章节添加必要的属性
+        for i, chapter in enumerate(self._iter_detected_chapters(detection_method)):
+            if 'href' not in chapter:
+                chapter['href'] = f'chapter_{i}.html'
+            if 'level' not in chapter:
+                chapter['level'] = 0
+            yield chapter
+    
+    def _iter_detected_chapters(self, detection_method):
+        """按指定的检测方法逐个产出章节，获取不到时依次尝试TOC和正则表达式"""
         if detection_method == 'xpath':
             # 使用XPath方法获取章节
-            for item in self.book.get_items():
-                if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                    html_content = item.get_content().decode('utf-8')
-                    xpath_chapters = self.split_by_xpath(html_content)
-                    if xpath_chapters:
-                        chapters.extend(xpath_chapters)
+            chapters = self._iter_xpath_chapters()
         elif detection_method == 'regex':
             # 使用正则表达式获取章节
-            all_text = self.extract_all_text()
-            chapters = self.split_by_regex(all_text)
+            chapters = self.split_by_regex(self.extract_all_text())
         elif detection_method == 'toc':
             # 使用TOC获取章节
-            chapters = self.get_toc_chapters(include_all=True)
+            chapters = self._iter_toc_chapters(include_all=True)
+        else:
+            chapters = ()
+        
+        found = False
+        for chapter in chapters:
+            found = True
+            yield chapter
         
         # 如果获取不到章节，尝试其他方法
-        if not chapters:
+        if not found:
             # 先尝试TOC
-            chapters = self.get_toc_chapters(include_all=True)
-            if not chapters:
+            for chapter in self._iter_toc_chapters(include_all=True):
+                found = True
+                yield chapter
+            if not found:
                 # 再尝试正则表达式
-                all_text = self.extract_all_text()
-                chapters = self.split_by_regex(all_text)
-        
-        # 为每个章节添加必要的属性
-        for i, chapter in enumerate(chapters):
-            if 'href' not in chapter:
-                chapter['href'] = f'chapter_{i}.html'
-            if 'level' not in chapter:
-                chapter['level'] = 0
-        
-        return chapters
+                yield from self.split_by_regex(self.extract_all_text())
     
     def split_into_chapters(self, detection_method='xpath'):
         """将Epub内容切分为章节"""
@@ -241,19 +348,18 @@ class EpubHandler:
     
     def _split_by_xpath(self, chapters):
         """使用XPath方法检测章节"""
-        for item in self.book.get_items():
-            if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                html_content = item.get_content().decode('utf-8')
-                xpath_chapters = self.split_by_xpath(html_content)
-                if xpath_chapters:
-                    chapters.extend(xpath_chapters)
+        chapters.extend(self._iter_xpath_chapters())
+    
+    def _iter_xpath_chapters(self):
+        """使用XPath方法逐个产出章节"""
+        # 各文档相互独立，并行检测并按原顺序产出，前面的文档完成即可先产出
+        for xpath_chapters in _imap_parallel(self.split_by_xpath, self._docs.values()):
+            yield from xpath_chapters
     
     def _split_by_regex(self, chapters):
         """使用正则表达式检测章节"""
         all_text = self.extract_all_text()
-        regex_chapters = self.split_by_regex(all_text)
-        if regex_chapters:
-            chapters.extend(regex_chapters)
+        chapters.extend(self.split_by_regex(all_text))
     
     def _split_by_toc(self, chapters):
         """使用TOC检测章节"""
@@ -263,18 +369,18 @@ class EpubHandler:
     
     def save_chapters_to_md(self, chapters, output_dir):
         """将章节保存为Markdown文件"""
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        if output_dir not in self._ensured_dirs:
+            os.makedirs(output_dir, exist_ok=True)
+            self._ensured_dirs.add(output_dir)
         
         saved_files = []
         for i, chapter in enumerate(chapters):
             # 清理文件名
-            safe_title = re.sub(r'[<>:"/\\|?*]', '_', chapter['title'])
+            safe_title = sanitize_filename(chapter['title'])
             md_path = os.path.join(output_dir, f"{safe_title}.md")
-            # 写入Markdown文件
-            with open(md_path, 'w', encoding='utf-8') as f:
-                f.write(f"# {chapter['title']}\n\n")
-                f.write(chapter['content'])
+            # 写入Markdown文件（一次性编码后以二进制写入）
+            with open(md_path, 'wb') as f:
+                f.write(f"# {chapter['title']}\n\n{chapter['content']}".encode('utf-8'))
             saved_files.append(md_path)
         
         return saved_files
\ No newline at end of file
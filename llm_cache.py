@@ -0,0 +1,76 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+class LLMCache:
+    """基于SQLite的AI响应缓存（精确匹配），支持过期时间和LRU淘汰"""
+    def __init__(self, db_path=None, ttl=30 * 24 * 3600, max_entries=10000):
+        if db_path is None:
+            db_path = os.path.join(os.path.expanduser('~'), '.epub2summary', 'cache.sqlite')
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # 连接会被多个请求线程共享，用锁串行化访问
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model, system_prompt, text):
+        """根据模型、提示词和输入文本生成缓存键"""
+        payload = json.dumps({"model": model, "sys": system_prompt, "user": text}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """读取缓存，未命中或已过期时返回None"""
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                value, created_at = row
+                if self.ttl and now - created_at > self.ttl:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                    return None
+                self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                return value
+        except sqlite3.Error as e:
+            print(f"读取缓存失败: {str(e)}")
+            return None
+
+    def set(self, key, value):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        now = time.time()
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                if self.max_entries:
+                    self._conn.execute(
+                        "DELETE FROM cache WHERE key IN "
+                        "(SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,)
+                    )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"写入缓存失败: {str(e)}")
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
@@ -1,19 +1,72 @@
 import os
 import sys
-import re
+import json
+import time
+import queue
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QLineEdit, QTextEdit, QProgressBar, QFileDialog,
+    QPushButton, QLineEdit, QTextEdit, QPlainTextEdit, QProgressBar, QFileDialog,
     QLabel, QGroupBox, QDialog, QFormLayout, QMessageBox, QMenuBar, QMenu,
-    QCheckBox, QScrollArea
+    QCheckBox, QListWidget, QListWidgetItem, QProgressDialog
 )
-from PyQt6.QtCore import Qt, pyqtSignal, QThread
+from PyQt6.QtCore import Qt, pyqtSignal, QThread, QTimer, QSignalBlocker
 from PyQt6.QtGui import QFont
 
-from epub_handler import EpubHandler
+from epub_handler import EpubHandler, sanitize_filename
 from ai_handler import AIHandler
 from config import ConfigManager
+from llm_cache import LLMCache
+
+# 日志合并发送：攒够一批或距上次发送超过一定时间后才发送一次信号
+_LOG_BATCH_SIZE = 32
+_LOG_INTERVAL = 0.1
+
+# 日志时间戳缓存[秒, 格式化结果]，同一秒内的日志复用格式化结果
+_ts_cache = [0, ""]
+
+# 流水线各阶段之间传递的结束标记
+_STAGE_DONE = object()
+
+# 断点续传清单：记录已完成总结的章节（文件名主干 -> 模型、提示词与章节文本的指纹）
+_MANIFEST_NAME = "manifest.json"
+
+def _unique_stem(stem, used):
+    """返回未被占用的文件名主干（重名时依次追加“ (2)”“ (3)”…），并记为已占用"""
+    # 按不区分大小写比较，避免在Windows等大小写不敏感的文件系统上写到同一文件
+    unique = stem
+    n = 2
+    while unique.casefold() in used:
+        unique = f"{stem} ({n})"
+        n += 1
+    used.add(unique.casefold())
+    return unique
+
+def _write_text_file(path, text):
+    """以UTF-8写入文本文件，绕过缓冲与编码包装层，通常只需一次write系统调用"""
+    data = memoryview(text.encode('utf-8'))
+    # O_BINARY（仅Windows）关闭换行转换，与其他输出文件一样统一使用\n换行
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        # 处理部分写入的情况
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+def _write_text_file_atomic(path, text):
+    """先写入临时文件再替换目标文件，中途失败不会留下不完整的文件"""
+    tmp_path = f"{path}.tmp"
+    try:
+        _write_text_file(tmp_path, text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
 
 class WorkerThread(QThread):
     """工作线程，处理耗时操作"""
@@ -25,24 +78,32 @@ class WorkerThread(QThread):
         super().__init__()
         self.epub_path = epub_path
         self.output_dir = output_dir
+        # 输出目录前缀（带结尾分隔符），逐章拼接文件路径时无需反复调用os.path.join
+        self._out = os.path.join(output_dir, '')
         self.ai_handler = ai_handler
         self.epub_handler = EpubHandler()
         self.selected_chapters = selected_chapters
         self.detection_method = detection_method  # 1: XPath, 2: 正则表达式, 3: TOC
+        # 待发送的日志与进度（写入线程和工作线程都会记录，用锁保护）
+        self._log_lock = threading.Lock()
+        self._log_buf = []
+        self._log_last = 0.0
+        self._log_timer = None
+        self._progress = None
     
     def run(self):
         """执行工作线程"""
         try:
             # 1. 加载Epub文件
-            self.update_log.emit(f"正在加载Epub文件: {self.epub_path}")
+            self._enqueue_log(f"正在加载Epub文件: {self.epub_path}")
             self.epub_handler.load_epub(self.epub_path)
             
             # 2. 获取章节（如果没有指定，自动切分）
             if self.selected_chapters:
                 chapters = self.selected_chapters
-                self.update_log.emit(f"使用用户选择的 {len(chapters)} 个章节")
+                self._enqueue_log(f"使用用户选择的 {len(chapters)} 个章节")
             else:
-                self.update_log.emit("正在切分章节...")
+                self._enqueue_log("正在切分章节...")
                 # 根据选择的检测方法执行相应的章节检测
                 detection_methods = {
                     1: 'xpath',
@@ -50,67 +111,209 @@ class WorkerThread(QThread):
                     3: 'toc'
                 }
                 method_name = detection_methods.get(self.detection_method, 'xpath')
-                self.update_log.emit(f"使用 {method_name} 方法检测章节")
+                self._enqueue_log(f"使用 {method_name} 方法检测章节")
                 chapters = self.epub_handler.split_into_chapters(method_name)
-                self.update_log.emit(f"成功切分 {len(chapters)} 个章节")
+                self._enqueue_log(f"成功切分 {len(chapters)} 个章节")
             
-            # 3. 转换为Markdown
-            self.update_log.emit("正在转换为Markdown...")
-            md_files = []
-            for i, chapter in enumerate(chapters):
-                # 清理文件名
-                safe_title = re.sub(r'[<>:"/\\|?*]', '_', chapter['title'])
-                md_path = os.path.join(self.output_dir, f"{safe_title}.md")
-                # 写入Markdown文件
-                with open(md_path, 'w', encoding='utf-8') as f:
-                    f.write(f"# {chapter['title']}\n\n")
-                    f.write(chapter['content'])
-                md_files.append(md_path)
-            self.update_log.emit(f"成功保存 {len(md_files)} 个Markdown文件")
+            # 3. 断点续传：清单中指纹一致且总结文件仍在的章节直接复用，只处理其余章节
+            os.makedirs(self.output_dir, exist_ok=True)
+            manifest = self._load_manifest()
+            summary_results = []
+            pending = []
+            # 标题清理后重名的章节使用不同的文件名主干，保证每个总结文件和清单条目只属于一个章节
+            used = set()
+            for idx, chapter in enumerate(chapters):
+                stem = _unique_stem(sanitize_filename(chapter['title']), used)
+                text = f"# {chapter['title']}\n\n{chapter['content']}"
+                key = LLMCache.make_key(self.ai_handler.model_name, self.ai_handler.system_prompt, text)
+                output_path = f"{self._out}{stem}_summary.md"
+                if manifest.get(stem) == key and os.path.exists(output_path):
+                    summary_results.append((idx, output_path))
+                else:
+                    pending.append((idx, stem, text, key))
+            if summary_results:
+                self._enqueue_log(f"跳过已完成总结的 {len(summary_results)} 个章节")
             
-            # 4. AI总结
-            self.update_log.emit("正在生成AI总结...")
-            total_files = len(md_files)
-            summary_files = []
+            # 4. 流水线：写入Markdown文件的同时并发生成AI总结，每完成一个章节立即保存其总结
+            self._enqueue_log("正在转换为Markdown并生成AI总结...")
+            total_files = len(pending)
+            # 已写入章节的(章节序号, 文件名主干, 文本, 指纹)，按章节顺序排列
+            md_entries = []
+            md_errors = []
+            # 有界队列：写入阶段最多领先总结阶段max_concurrency个章节
+            md_queue = queue.Queue(maxsize=max(1, self.ai_handler.max_concurrency))
+            stop_event = threading.Event()
+            writer = threading.Thread(
+                target=self._write_markdown_stage,
+                args=(pending, md_queue, md_entries, md_errors, stop_event),
+                daemon=True
+            )
+            writer.start()
             
-            for i, md_file in enumerate(md_files):
-                try:
-                    self.update_log.emit(f"正在处理文件 {i+1}/{total_files}: {os.path.basename(md_file)}")
-                    # 生成输出路径
-                    base_name = os.path.basename(md_file)
-                    output_path = os.path.join(self.output_dir, f"{os.path.splitext(base_name)[0]}_summary.md")
-                    # 生成总结
-                    with open(md_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    summary = self.ai_handler.generate_summary(content)
-                    # 保存总结
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        f.write(f"# {os.path.splitext(base_name)[0]} 总结\n\n")
-                        f.write(summary)
-                    self.update_log.emit(f"成功生成总结: {os.path.basename(output_path)}")
-                    summary_files.append(output_path)
+            completed = 0
+            try:
+                for i, summary, error in self.ai_handler.generate_summaries_batch(iter(md_queue.get, _STAGE_DONE)):
+                    idx, stem, _, key = md_entries[i]
+                    completed += 1
+                    try:
+                        if error is not None:
+                            raise error
+                        # 生成输出路径
+                        summary_name = f"{stem}_summary.md"
+                        output_path = f"{self._out}{summary_name}"
+                        # 保存总结（原子替换，中途失败不会留下不完整的总结），并记录到续传清单
+                        _write_text_file_atomic(output_path, f"# {stem} 总结\n\n{summary}")
+                        manifest[stem] = key
+                        self._save_manifest(manifest)
+                        self._enqueue_log(f"成功生成总结 {completed}/{total_files}: {summary_name}")
+                        summary_results.append((idx, output_path))
+                    except Exception as e:
+                        self._enqueue_log(f"处理文件失败 {stem}.md: {str(e)}")
                     # 更新进度
-                    self.update_progress.emit(int((i+1) / total_files * 100))
-                except Exception as e:
-                    self.update_log.emit(f"处理文件失败 {os.path.basename(md_file)}: {str(e)}")
-                    continue
+                    self._set_progress(int(completed / total_files * 100))
+            finally:
+                # 无论正常结束还是出错，都通知写入阶段停止
+                stop_event.set()
+                writer.join()
+            
+            # 写入阶段的异常在此抛出，使任务失败
+            if md_errors:
+                raise md_errors[0]
+            
+            # 按章节原始顺序排列总结文件
+            summary_results.sort()
+            summary_files = [output_path for _, output_path in summary_results]
             
             # 5. 合并所有总结为summary.md
             if summary_files:
-                self.update_log.emit("正在合并所有章节总结...")
-                summary_md_path = os.path.join(self.output_dir, "summary.md")
+                self._enqueue_log("正在合并所有章节总结...")
+                summary_md_path = f"{self._out}summary.md"
                 try:
-                    self.ai_handler.merge_summaries(summary_files, summary_md_path)
-                    self.update_log.emit(f"成功合并生成总览文件: {os.path.basename(summary_md_path)}")
+                    # summary_files已按章节原始顺序排列，无需再按文件名中的编号排序
+                    self.ai_handler.merge_summaries(summary_files, summary_md_path, sort=False)
+                    self._enqueue_log(f"成功合并生成总览文件: {os.path.basename(summary_md_path)}")
                 except Exception as e:
-                    self.update_log.emit(f"合并总结失败: {str(e)}")
+                    self._enqueue_log(f"合并总结失败: {str(e)}")
             
-            self.update_log.emit("所有任务完成！")
-            self.update_progress.emit(100)
+            self._enqueue_log("所有任务完成！")
+            self._set_progress(100)
+            self._flush_log()
             self.task_complete.emit(True, "处理完成")
         except Exception as e:
-            self.update_log.emit(f"处理失败: {str(e)}")
+            self._enqueue_log(f"处理失败: {str(e)}")
+            self._flush_log()
             self.task_complete.emit(False, str(e))
+    
+    def _enqueue_log(self, message):
+        """记录日志，合并后批量发送，避免大量跨线程信号挤占界面线程"""
+        with self._log_lock:
+            self._log_buf.append(message)
+            self._schedule_flush()
+    
+    def _set_progress(self, value):
+        """记录进度，与日志一起节流发送"""
+        with self._log_lock:
+            self._progress = value
+            self._schedule_flush()
+    
+    def _schedule_flush(self):
+        """达到批量大小或发送间隔时立即发送，否则稍后发送（调用方需持有锁）"""
+        if len(self._log_buf) >= _LOG_BATCH_SIZE or time.monotonic() - self._log_last >= _LOG_INTERVAL:
+            self._flush_locked()
+        elif self._log_timer is None:
+            # 确保之后没有新日志时，已缓冲的内容也会及时发送
+            self._log_timer = threading.Timer(_LOG_INTERVAL, self._flush_log)
+            self._log_timer.daemon = True
+            self._log_timer.start()
+    
+    def _flush_log(self):
+        """立即发送所有缓冲的日志和最新进度"""
+        with self._log_lock:
+            self._flush_locked()
+    
+    def _flush_locked(self):
+        """发送缓冲内容（调用方需持有锁，保证多线程下日志顺序不乱）"""
+        if self._log_timer is not None:
+            self._log_timer.cancel()
+            self._log_timer = None
+        if self._log_buf:
+            self.update_log.emit('\n'.join(self._log_buf))
+            self._log_buf = []
+        if self._progress is not None:
+            self.update_progress.emit(self._progress)
+            self._progress = None
+        self._log_last = time.monotonic()
+    
+    def _load_manifest(self):
+        """读取输出目录中的断点续传清单（不存在或损坏时返回空清单）"""
+        try:
+            with open(f"{self._out}{_MANIFEST_NAME}", 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            return manifest if isinstance(manifest, dict) else {}
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_manifest(self, manifest):
+        """保存断点续传清单"""
+        _write_text_file_atomic(f"{self._out}{_MANIFEST_NAME}", json.dumps(manifest, ensure_ascii=False, indent=2))
+    
+    def _write_markdown(self, entry):
+        """写入单个章节的Markdown文件，entry为(章节序号, 文件名主干, 文本, 指纹)，原样返回"""
+        _write_text_file(f"{self._out}{entry[1]}.md", entry[2])
+        return entry
+    
+    def _write_markdown_stage(self, pending, md_queue, md_entries, md_errors, stop_event):
+        """流水线写入阶段：并行写入Markdown文件，并按章节顺序把文本直接交给总结阶段（不再从磁盘读回）"""
+        # pending中的文件名主干已在run中去重，并行写入时不会有两个线程写同一文件
+        executor = ThreadPoolExecutor(max_workers=min(16, (os.cpu_count() or 1) * 4))
+        # 写入在线程池中并行进行，按章节顺序取结果
+        futures = [executor.submit(self._write_markdown, entry) for entry in pending]
+        try:
+            for future in futures:
+                entry = future.result()
+                if stop_event.is_set():
+                    return
+                md_entries.append(entry)
+                self._put_until_stopped(md_queue, entry[2], stop_event)
+            self._enqueue_log(f"成功保存 {len(md_entries)} 个Markdown文件")
+        except Exception as e:
+            # 记录异常，由run在总结阶段结束后抛出
+            md_errors.append(e)
+        finally:
+            # 停止或出错时取消尚未开始的写入
+            for future in futures:
+                future.cancel()
+            executor.shutdown()
+            # 结束标记，通知总结阶段不再有新章节
+            self._put_until_stopped(md_queue, _STAGE_DONE, stop_event)
+    
+    @staticmethod
+    def _put_until_stopped(q, item, stop_event):
+        """向有界队列放入数据，队列已满时等待，收到停止信号后放弃"""
+        while not stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+class PreloadThread(QThread):
+    """预加载线程，在后台加载Epub文件，避免界面卡顿"""
+    load_complete = pyqtSignal(object)
+    load_failed = pyqtSignal(str)
+    
+    def __init__(self, epub_path, parent=None):
+        super().__init__(parent)
+        self.epub_path = epub_path
+    
+    def run(self):
+        """加载Epub文件，完成后发送加载好的EpubHandler"""
+        try:
+            epub_handler = EpubHandler()
+            epub_handler.load_epub(self.epub_path)
+            self.load_complete.emit(epub_handler)
+        except Exception as e:
+            self.load_failed.emit(str(e))
 
 class ChapterSelectionDialog(QDialog):
     """章节选择对话框"""
@@ -127,12 +330,13 @@ class ChapterSelectionDialog(QDialog):
         """初始化UI"""
         layout = QVBoxLayout()
         
-        # 获取所有章节
-        self.chapters = self.epub_handler.get_all_chapters(self.detection_method)
+        # 章节在对话框显示后逐个检测并加入列表
+        self.chapters = []
+        self._chapter_iter = self.epub_handler.iter_all_chapters(self.detection_method)
         
         # 标题
-        title_label = QLabel(f"共 {len(self.chapters)} 章")
-        layout.addWidget(title_label)
+        self.title_label = QLabel("正在获取章节...")
+        layout.addWidget(self.title_label)
         
         # 全选/取消全选
         select_layout = QHBoxLayout()
@@ -142,30 +346,16 @@ class ChapterSelectionDialog(QDialog):
         select_layout.addWidget(self.select_all_checkbox)
         layout.addLayout(select_layout)
         
-        # 章节列表
-        self.chapter_list_layout = QVBoxLayout()
-        self.chapter_checkboxes = []
-        
-        for chapter in self.chapters:
-            checkbox = QCheckBox(chapter['title'])
-            checkbox.setChecked(True)
-            self.chapter_checkboxes.append(checkbox)
-            self.chapter_list_layout.addWidget(checkbox)
-        
-        # 添加滚动区域
-        scroll_widget = QWidget()
-        scroll_widget.setLayout(self.chapter_list_layout)
-        
-        scroll_area = QScrollArea()
-        scroll_area.setWidget(scroll_widget)
-        scroll_area.setWidgetResizable(True)
-        layout.addWidget(scroll_area)
+        # 章节列表（列表项自带复选框，只绘制可见行，章节很多时也无需为每章创建控件）
+        self.chapter_list = QListWidget()
+        layout.addWidget(self.chapter_list)
         
         # 按钮布局
         button_layout = QHBoxLayout()
         
-        # 确定按钮
+        # 确定按钮（章节获取完成前不可用）
         self.ok_button = QPushButton("确定")
+        self.ok_button.setEnabled(False)
         self.ok_button.clicked.connect(self.accept)
         button_layout.addWidget(self.ok_button)
         
@@ -177,17 +367,57 @@ class ChapterSelectionDialog(QDialog):
         layout.addLayout(button_layout)
         
         self.setLayout(layout)
+        
+        # 在事件循环中逐个加入章节，界面不会因章节检测而卡住
+        QTimer.singleShot(0, self._add_next_chapter)
+    
+    def _add_next_chapter(self):
+        """从章节生成器中取出下一章加入列表，并安排下一次添加"""
+        if self._chapter_iter is None:
+            return
+        try:
+            chapter = next(self._chapter_iter)
+        except StopIteration:
+            self._chapter_iter = None
+            self.title_label.setText(f"共 {len(self.chapters)} 章")
+            self.ok_button.setEnabled(True)
+            return
+        except Exception as e:
+            self._chapter_iter = None
+            self.title_label.setText(f"获取章节失败: {str(e)}")
+            return
+        
+        self.chapters.append(chapter)
+        item = QListWidgetItem(chapter['title'])
+        item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+        item.setCheckState(Qt.CheckState.Checked if self.select_all_checkbox.isChecked() else Qt.CheckState.Unchecked)
+        self.chapter_list.addItem(item)
+        self.title_label.setText(f"正在获取章节... 已获取 {len(self.chapters)} 章")
+        QTimer.singleShot(0, self._add_next_chapter)
+    
+    def done(self, result):
+        """关闭对话框时停止获取章节"""
+        if self._chapter_iter is not None:
+            self._chapter_iter.close()
+            self._chapter_iter = None
+        super().done(result)
     
     def toggle_select_all(self, state):
         """全选/取消全选"""
-        for checkbox in self.chapter_checkboxes:
-            checkbox.setChecked(state == Qt.CheckState.Checked)
+        # stateChanged传入的是整数，需转换为枚举再比较
+        check_state = Qt.CheckState.Checked if Qt.CheckState(state) == Qt.CheckState.Checked else Qt.CheckState.Unchecked
+        # 批量修改期间屏蔽模型信号，避免每个条目都触发一次视图更新，最后统一重绘
+        blocker = QSignalBlocker(self.chapter_list.model())
+        for i in range(self.chapter_list.count()):
+            self.chapter_list.item(i).setCheckState(check_state)
+        blocker.unblock()
+        self.chapter_list.viewport().update()
     
     def accept(self):
         """确认选择"""
         self.selected_chapters = []
-        for i, checkbox in enumerate(self.chapter_checkboxes):
-            if checkbox.isChecked():
+        for i in range(self.chapter_list.count()):
+            if self.chapter_list.item(i).checkState() == Qt.CheckState.Checked:
                 self.selected_chapters.append(self.chapters[i])
         super().accept()
     
@@ -273,6 +503,8 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.config_manager = ConfigManager()
         self.ai_handler = AIHandler(self.config_manager.config)
+        self.preload_thread = None
+        self.preload_progress = None
         self.init_ui()
     
     def init_ui(self):
@@ -369,8 +601,10 @@ class MainWindow(QMainWindow):
         log_layout.addWidget(self.progress_bar)
         
         # 日志显示
-        self.log_text = QTextEdit()
+        # 纯文本日志框追加时无需重新排版富文本，并限制保留的行数
+        self.log_text = QPlainTextEdit()
         self.log_text.setReadOnly(True)
+        self.log_text.setMaximumBlockCount(5000)
         self.log_text.setFont(QFont("Consolas", 10))
         log_layout.addWidget(self.log_text)
         
@@ -434,14 +668,58 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "警告", "请选择输出目录")
             return
         
-        # 预加载Epub文件以获取章节列表
+        # 在后台线程中预加载Epub文件以获取章节列表，加载期间界面保持响应
         self.append_log("正在加载Epub文件以获取章节列表...")
+        self.start_button.setEnabled(False)
+        
+        preload_thread = PreloadThread(epub_path, self)
+        preload_thread.load_complete.connect(
+            lambda epub_handler: self.on_preload_complete(preload_thread, epub_handler, epub_path, output_dir))
+        preload_thread.load_failed.connect(lambda message: self.on_preload_failed(preload_thread, message))
+        preload_thread.finished.connect(preload_thread.deleteLater)
+        self.preload_thread = preload_thread
+        
+        # 加载较慢时显示进度对话框，可取消
+        self.preload_progress = QProgressDialog("正在加载Epub文件...", "取消", 0, 0, self)
+        self.preload_progress.setWindowTitle("加载中")
+        self.preload_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.preload_progress.setMinimumDuration(500)
+        self.preload_progress.canceled.connect(self.on_preload_canceled)
+        
+        preload_thread.start()
+    
+    def _finish_preload(self, preload_thread):
+        """结束预加载状态，返回该线程的结果是否仍然有效（已取消的加载返回False）"""
+        if preload_thread is not self.preload_thread:
+            return False
+        self.preload_thread = None
+        # reset不会触发canceled信号
+        self.preload_progress.reset()
+        self.preload_progress.deleteLater()
+        self.preload_progress = None
+        self.start_button.setEnabled(True)
+        return True
+    
+    def on_preload_canceled(self):
+        """取消预加载（后台线程无法安全中断，结束后忽略其结果）"""
+        self.preload_thread = None
+        self.preload_progress.deleteLater()
+        self.preload_progress = None
+        self.start_button.setEnabled(True)
+        self.append_log("已取消加载Epub文件")
+    
+    def on_preload_failed(self, preload_thread, message):
+        """预加载失败处理"""
+        if not self._finish_preload(preload_thread):
+            return
+        QMessageBox.critical(self, "错误", f"加载Epub文件失败: {message}")
+    
+    def on_preload_complete(self, preload_thread, temp_epub_handler, epub_path, output_dir):
+        """预加载完成，显示章节选择对话框并开始处理"""
+        if not self._finish_preload(preload_thread):
+            return
         
         try:
-            # 创建临时的EpubHandler实例来获取章节
-            temp_epub_handler = EpubHandler()
-            temp_epub_handler.load_epub(epub_path)
-            
             # 获取用户选择的章节检测方法
             detection_method = self.detection_group.id(self.detection_group.checkedButton())
             detection_methods = {
@@ -489,10 +767,14 @@ class MainWindow(QMainWindow):
             return
     
     def append_log(self, message):
-        """添加日志信息"""
-        self.log_text.append(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}")
-        # 自动滚动到底部
-        self.log_text.verticalScrollBar().setValue(self.log_text.verticalScrollBar().maximum())
+        """添加日志信息（工作线程会合并发送，message可能包含多行）"""
+        now = int(time.time())
+        if now != _ts_cache[0]:
+            _ts_cache[0] = now
+            _ts_cache[1] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))
+        timestamp = _ts_cache[1]
+        # 视图位于底部时会自动滚动
+        self.log_text.appendPlainText('\n'.join(f"[{timestamp}] {line}" for line in message.split('\n')))
     
     def update_progress(self, value):
         """更新进度条"""
@@ -511,7 +793,6 @@ class MainWindow(QMainWindow):
         self.browse_output_button.setEnabled(True)
 
 if __name__ == "__main__":
-    import time
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()